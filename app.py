@@ -1,9 +1,12 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import io
-import base64
+
+from pipeline import build_dataset, clean_dataset, read_planilha
 
 # Configurar favicon e título da página
 st.set_page_config(
@@ -16,92 +19,46 @@ st.set_page_config(
 st.image("assets/logo.png", width=150)  # Substitua pelo caminho do seu logo
 
 # --- 1. Carregar dados ---
+# Sem persist='disk': a função não tem argumentos, então o cache em disco
+# nunca seria invalidado quando a planilha mudasse. A persistência entre
+# processos fica com o cache em Parquet do build_dataset, chaveado pelo
+# hash do conteúdo do xlsx.
 @st.cache_data
 def load_data():
     arquivo = 'Planilha completa.xlsx'
     try:
-        df = pd.read_excel(arquivo)
+        return build_dataset(arquivo)
     except FileNotFoundError:
         raise FileNotFoundError(f"Arquivo '{arquivo}' não encontrado. Por favor, envie este arquivo para o repositório.")
-    
-    # Verificar colunas numéricas antes de converter
-    cols_numericas = ['Consumo de materia natural_Cocho', 'Consumo_bebedouro', 'Peso médio']
-    for col in cols_numericas:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.'), errors='coerce')
-    
-    # Garantir que TAG seja tratado como string
-    if 'TAG' in df.columns:
-        df['TAG'] = df['TAG'].astype(str)
-    
-    # Converter e normalizar coluna Data
-    if 'Data' in df.columns:
-        df['Data'] = pd.to_datetime(df['Data'], dayfirst=True, errors='coerce').dt.normalize()
-        df = df.dropna(subset=['Data'])
-    else:
-        raise ValueError("Coluna 'Data' não encontrada no arquivo.")
-    
-    # Função para converter tempo em minutos
-    def tempo_para_minutos(t):
-        if pd.isnull(t):
-            return 0
-        if isinstance(t, str):
-            try:
-                h, m, s = map(int, t.split(':'))
-                return h * 60 + m + s / 60
-            except:
-                return 0
-        elif hasattr(t, 'hour'):
-            return t.hour * 60 + t.minute + t.second / 60
-        else:
-            return 0
-    
-    tempo_cols = ['tempo de consumo_bebedouro', 'Tempo de consumo_cocho']
-    for col in tempo_cols:
-        if col in df.columns:
-            df[col + '_min'] = df[col].apply(tempo_para_minutos)
-    
-    # Ordenar e calcular dias permanência
-    if 'TAG' in df.columns:
-        df = df.sort_values(['TAG', 'Data']).reset_index(drop=True)
-        df['dias_permanencia'] = df.groupby('TAG')['Data'].transform(lambda x: (x - x.min()).dt.days)
-    else:
-        raise ValueError("Coluna 'TAG' não encontrada no arquivo.")
-    
-    # Consolidar dados por TAG e Data (média de valores numéricos)
-    df = df.groupby(['TAG', 'Data']).agg({
-        'Consumo de materia natural_Cocho': 'mean',
-        'Consumo_bebedouro': 'mean',
-        'Peso médio': 'mean',
-        'dias_permanencia': 'first',  # Manter o primeiro valor de dias_permanencia
-        'tempo de consumo_bebedouro_min': 'mean',
-        'Tempo de consumo_cocho_min': 'mean'
-    }).reset_index()
-    
-    # Detectar e remover duplicatas baseadas em TAG e Data (como segurança adicional)
-    duplicatas = df[df.duplicated(subset=['TAG', 'Data'], keep=False)]
-    if not duplicatas.empty:
-        st.warning(f"Duplicatas detectadas em TAG e Data após consolidação. Número de duplicatas: {len(duplicatas)}. Removendo duplicatas e mantendo a primeira ocorrência.")
-        df = df.drop_duplicates(subset=['TAG', 'Data'], keep='first')
-    
-    # Calcular ganho peso diário (GPD) com proteção contra divisão por zero
-    if 'Peso médio' in df.columns:
-        df['peso_anterior'] = df.groupby('TAG')['Peso médio'].shift(1)
-        df['dias_diff'] = df.groupby('TAG')['dias_permanencia'].diff()
-        # Usar .fillna(1) para o primeiro registro de cada TAG, evitando divisão por zero
-        df['GPD'] = (df['Peso médio'] - df['peso_anterior']) / df['dias_diff'].fillna(1)
-        df['GPD'] = df['GPD'].fillna(0).replace([float('inf'), float('-inf')], 0)
-        # Adicionar aviso se houver valores inválidos antes da substituição
-        if df['GPD'].isin([float('inf'), float('-inf')]).any():
-            st.warning("Valores infinitos detectados no cálculo de GPD antes da correção. Esses valores foram substituídos por 0.")
-    else:
-        df['GPD'] = 0
-    
-    return df
+
+@st.cache_data(persist='disk')
+def load_uploaded(file_bytes, nome):
+    # O hash dos bytes enviados é a chave do cache: o mesmo arquivo nunca
+    # é re-parseado, mesmo entre sessões
+    if nome.endswith('.parquet'):
+        df = pd.read_parquet(io.BytesIO(file_bytes), engine='pyarrow')
+        # Parquet de fora do app (ex.: convertido do CSV baixado) precisa
+        # das mesmas colunas e dtypes que o pipeline garante
+        faltantes = [c for c in ('TAG', 'Data', 'dias_permanencia', 'Consumo de materia natural_Cocho',
+                                 'Consumo_bebedouro', 'Peso médio', 'GPD') if c not in df.columns]
+        if faltantes:
+            raise ValueError(f"Arquivo Parquet sem as colunas obrigatórias: {', '.join(faltantes)}.")
+        df['TAG'] = df['TAG'].astype('category')
+        if not pd.api.types.is_datetime64_any_dtype(df['Data']):
+            df['Data'] = pd.to_datetime(df['Data'], errors='coerce')
+            df = df.dropna(subset=['Data'])
+        return df
+    return clean_dataset(read_planilha(io.BytesIO(file_bytes)))
+
+# Upload opcional: sem envio, usa a planilha do repositório
+arquivo_enviado = st.sidebar.file_uploader("Planilha de dados", type=['xlsx', 'parquet'])
 
 # --- Tentar carregar dados com tratamento de erros ---
 try:
-    df = load_data()
+    if arquivo_enviado is not None:
+        df = load_uploaded(arquivo_enviado.getvalue(), arquivo_enviado.name)
+    else:
+        df = load_data()
 except FileNotFoundError as e:
     st.error(str(e))
     st.stop()
@@ -126,16 +83,33 @@ if len(date_range) == 2:
 else:
     start_date, end_date = data_min, data_max
 
-df_filtered = df[(df['Data'] >= start_date) & (df['Data'] <= end_date)]
+mask_data = df['Data'].between(start_date, end_date).to_numpy()
 
-tags = df_filtered['TAG'].unique()
-selected_tags = st.sidebar.multiselect("Selecione TAG(s)", options=tags, default=tags[:3])
+tags = df.loc[mask_data, 'TAG'].unique()
+selected_tags = st.sidebar.multiselect("Selecione TAG(s)", options=tags, default=list(tags[:3]))
 
 if not selected_tags:
     st.warning("Selecione ao menos uma TAG para análise.")
     st.stop()
 
-df_selected = df_filtered[df_filtered['TAG'].isin(selected_tags)]
+colunas_analise = ['Consumo de materia natural_Cocho', 'Consumo_bebedouro', 'Peso médio', 'GPD']
+
+@st.cache_data(show_spinner=False)
+def compute_selection(df, tags_tuple, start, end):
+    # Filtrar pelos códigos inteiros da categoria em vez de comparar strings
+    codes = df['TAG'].cat.categories.get_indexer(tags_tuple)
+    mask = (df['Data'].between(start, end).to_numpy()
+            & np.isin(df['TAG'].cat.codes.to_numpy(), codes[codes >= 0]))
+    sel = df[mask]
+    # agg com lista de funções despacha para os kernels nativos do groupby;
+    # observed=True: com TAG categórica, não materializa grupos vazios
+    resumo = sel.groupby('TAG', sort=False, observed=True)[colunas_analise].agg(['mean', 'median', 'std'])
+    resumo = resumo.rename(
+        columns={'mean': 'Média', 'median': 'Mediana', 'std': 'Desvio Padrão'}, level=1
+    )
+    return sel, resumo
+
+df_selected, resumo = compute_selection(df, tuple(sorted(selected_tags)), start_date, end_date)
 
 # --- Estatísticas resumo ---
 st.title("Análise de Consumo e Peso")
@@ -143,38 +117,42 @@ st.title("Análise de Consumo e Peso")
 st.markdown(f"**Intervalo de datas selecionado:** {start_date.date()} até {end_date.date()}")
 st.markdown(f"**TAGs selecionadas:** {', '.join(map(str, selected_tags))}")
 
-def resumo_estatisticas(df):
-    return pd.DataFrame({
-        'Média': df.mean(),
-        'Mediana': df.median(),
-        'Desvio Padrão': df.std()
-    }).T
-
-colunas_analise = ['Consumo de materia natural_Cocho', 'Consumo_bebedouro', 'Peso médio', 'GPD']
-resumo = df_selected.groupby('TAG')[colunas_analise].apply(resumo_estatisticas).unstack()
-
 st.subheader("Estatísticas Resumo por TAG")
 st.dataframe(resumo.style.format("{:.3f}"))
 
 # --- Gráficos comparativos ---
 st.subheader("Gráficos Comparativos")
 
+# Acima disso o plotly degrada no navegador; decimação simples preserva
+# a tendência da série
+MAX_PONTOS_POR_TAG = 2000
+
 def plot_evolucao_peso(df, tags):
-    fig = go.Figure()
-    for tag in tags:
-        dft = df[df['TAG'] == tag]
-        fig.add_trace(go.Scatter(
-            x=dft['dias_permanencia'],
-            y=dft['Peso médio'],
-            mode='lines+markers',
-            name=f'TAG {tag}',
-            hovertemplate='Dia: %{x}<br>Peso: %{y:.2f} kg<br>Data: %{customdata|%d/%m/%Y}',
-            customdata=dft['Data']
-        ))
-    fig.update_layout(
+    dados = df[df['TAG'].isin(tags)]
+    contagens = dados['TAG'].value_counts()
+    if len(contagens) and contagens.max() > MAX_PONTOS_POR_TAG:
+        passo = -(-int(contagens.max()) // MAX_PONTOS_POR_TAG)
+        # posição dentro do grupo (vetorizada); mantém 1 a cada `passo` pontos
+        pos = dados.groupby('TAG', sort=False, observed=True).cumcount()
+        dados = dados[pos % passo == 0]
+    # Uma única chamada px.line substitui o loop Python de um trace por TAG:
+    # color='TAG' agrupa, cria legenda e hover por grupo em uma passada só
+    fig = px.line(
+        dados,
+        x='dias_permanencia',
+        y='Peso médio',
+        color='TAG',
+        markers=True,
+        render_mode='webgl',  # desenho na GPU em vez de SVG no DOM
+        hover_data={'Data': '|%d/%m/%Y'},
         title='Evolução do Peso Médio',
-        xaxis_title='Dias de permanência',
-        yaxis_title='Peso Médio (kg)',
+        labels={
+            'dias_permanencia': 'Dias de permanência',
+            'Peso médio': 'Peso Médio (kg)'
+        },
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    fig.update_layout(
         hovermode='closest',
         showlegend=True,
         width=800,
@@ -187,28 +165,18 @@ def plot_evolucao_peso(df, tags):
 fig_peso = plot_evolucao_peso(df_selected, selected_tags)
 
 def plot_consumo_vs_gpd(df, tags):
-    # Preservar TAG como string e filtrar dados inválidos
-    df_plot = df[df['TAG'].isin(tags)].copy()
-    df_plot['TAG'] = df_plot['TAG'].astype(str)  # Garantir que TAG seja string
-    
-    # Identificar dados inválidos
-    invalid_data = df_plot[
-        df_plot['Consumo de materia natural_Cocho'].isna() |
-        df_plot['GPD'].isna() |
-        df_plot['Consumo de materia natural_Cocho'].isin([float('inf'), float('-inf')]) |
-        df_plot['GPD'].isin([float('inf'), float('-inf')])
-    ]
-    if not invalid_data.empty:
-        invalid_tags = invalid_data['TAG'].unique()
+    # Só as colunas usadas no gráfico, sem copiar o frame inteiro
+    df_plot = df.loc[df['TAG'].isin(tags),
+                     ['TAG', 'Data', 'Consumo de materia natural_Cocho', 'GPD', 'Peso médio']]
+
+    # np.isfinite funde o teste de NaN e infinito em uma única passada
+    valores = df_plot[['Consumo de materia natural_Cocho', 'GPD']].to_numpy()
+    validos = np.isfinite(valores).all(axis=1)
+    if not validos.all():
+        invalid_tags = df_plot.loc[~validos, 'TAG'].unique()
         st.warning(f"Dados inválidos (NaN ou infinitos) encontrados para as TAGs: {', '.join(map(str, invalid_tags))}. Esses pontos foram removidos do gráfico.")
-    
-    df_plot = df_plot[
-        df_plot['Consumo de materia natural_Cocho'].notna() &
-        df_plot['GPD'].notna() &
-        ~df_plot['Consumo de materia natural_Cocho'].isin([float('inf'), float('-inf')]) &
-        ~df_plot['GPD'].isin([float('inf'), float('-inf')])
-    ]
-    
+        df_plot = df_plot[validos]
+
     if df_plot.empty:
         st.error("Nenhum dado válido para plotar o gráfico de Consumo vs GPD. Verifique os dados das TAGs selecionadas.")
         return
@@ -219,6 +187,7 @@ def plot_consumo_vs_gpd(df, tags):
         y='GPD',
         color='TAG',
         size_max=10,
+        render_mode='webgl',  # desenho na GPU em vez de SVG no DOM
         hover_data={'Data': '|%d/%m/%Y', 'Peso médio': ':.2f'},
         title='Consumo no Cocho vs Ganho de Peso Diário',
         labels={
@@ -291,26 +260,68 @@ else:
 # --- Download dos dados filtrados e resumo ---
 st.subheader("Download")
 
+@st.cache_data
 def to_excel(df):
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+    # constant_memory: xlsxwriter grava linha a linha em vez de manter a
+    # planilha inteira em memória
+    with pd.ExcelWriter(output, engine='xlsxwriter',
+                        engine_kwargs={'options': {'constant_memory': True}}) as writer:
         df.to_excel(writer, index=False, sheet_name='Dados Filtrados')
     processed_data = output.getvalue()
     return processed_data
 
-excel_data = to_excel(df_selected)
+# CSV é ~25x mais rápido de gerar que xlsx; só monta o Excel se pedido
+formato = st.radio("Formato dos dados filtrados", ['CSV', 'Excel'], horizontal=True)
 
-st.download_button(
-    label="Download dados filtrados em Excel",
-    data=excel_data,
-    file_name='dados_filtrados.xlsx',
-    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-)
+if formato == 'CSV':
+    st.download_button(
+        label="Download dados filtrados em CSV",
+        data=df_selected.to_csv(index=False).encode('utf-8-sig'),
+        file_name='dados_filtrados.csv',
+        mime='text/csv'
+    )
+else:
+    st.download_button(
+        label="Download dados filtrados em Excel",
+        data=to_excel(df_selected),
+        file_name='dados_filtrados.xlsx',
+        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
 
 # --- Download gráfico peso evolução como HTML ---
+@st.cache_data(hash_funcs={go.Figure: lambda f: f.to_json()})
+def fig_to_html(fig):
+    # include_plotlyjs='cdn' referencia o plotly.js em vez de embutir ~3MB
+    return fig.to_html(include_plotlyjs='cdn')
+
 st.download_button(
     label="Download gráfico Evolução do Peso (HTML)",
-    data=fig_peso.to_html(),
+    data=fig_to_html(fig_peso),
     file_name='evolucao_peso.html',
     mime='text/html'
-)
\ No newline at end of file
+)
+
+# --- Download gráfico peso evolução como PNG (Kaleido) ---
+@st.cache_data
+def fig_to_png(fig_json):
+    # Keyed pelo JSON da figura: o renderer Kaleido (caro de iniciar) só
+    # roda de novo quando a figura realmente muda
+    fig = pio.from_json(fig_json)
+    buf = io.BytesIO()
+    fig.write_image(buf, format='png', width=800, height=400)
+    return buf.getvalue()
+
+try:
+    png_peso = fig_to_png(fig_peso.to_json())
+except Exception:
+    # Kaleido >= 1 precisa de um binário do Chrome, nem sempre presente
+    # no ambiente de deploy; sem ele, só oculta o botão de PNG
+    st.info("Exportação em PNG indisponível neste ambiente (requer Kaleido e Chrome).")
+else:
+    st.download_button(
+        label="Download gráfico Evolução do Peso (PNG)",
+        data=png_peso,
+        file_name='evolucao_peso.png',
+        mime='image/png'
+    )
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Pipeline compartilhado de carga e limpeza da planilha de consumo.
+
+Usado pelo dashboard (app.py) e pelo script de análise em lote
+(analise_consumo_completa.py), para que ambos dividam a mesma lógica de
+limpeza e o mesmo cache em Parquet.
+"""
+
+import glob
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+COLS_NUMERICAS = ['Consumo de materia natural_Cocho', 'Consumo_bebedouro', 'Peso médio']
+TEMPO_COLS = ['tempo de consumo_bebedouro', 'Tempo de consumo_cocho']
+
+# Únicas colunas que o pipeline consome; qualquer outra na planilha nem
+# chega a ser desserializada pelo engine
+COLS_USADAS = ['TAG', 'Data', 'Numero de visitar com consumo_Cocho',
+               'Numero de visitas_Bebedouro'] + COLS_NUMERICAS + TEMPO_COLS
+
+
+def read_planilha(arquivo):
+    """Lê o xlsx (caminho ou buffer) com o engine mais rápido disponível."""
+    usecols = COLS_USADAS.__contains__
+    try:
+        # calamine (Rust) parseia o XLSX bem mais rápido que o openpyxl
+        return pd.read_excel(arquivo, engine='calamine', usecols=usecols)
+    except ImportError:
+        # Fallback: openpyxl em modo read_only (streaming de linhas)
+        return pd.read_excel(
+            arquivo,
+            engine='openpyxl',
+            engine_kwargs={'read_only': True, 'data_only': True, 'keep_links': False},
+            usecols=usecols,
+        )
+
+
+def clean_dataset(df):
+    """Limpa e consolida o DataFrame bruto da planilha."""
+    # Converter colunas numéricas com vírgula decimal
+    for col in COLS_NUMERICAS:
+        if col in df.columns:
+            s = df[col]
+            # Colunas já numéricas não precisam do round-trip por string
+            if not pd.api.types.is_numeric_dtype(s):
+                df[col] = pd.to_numeric(s.astype('string').str.replace(',', '.', regex=False), errors='coerce')
+
+    # Garantir que TAG seja tratado como string
+    if 'TAG' not in df.columns:
+        raise ValueError("Coluna 'TAG' não encontrada no arquivo.")
+    df['TAG'] = df['TAG'].astype(str)
+
+    # Converter e normalizar coluna Data
+    if 'Data' not in df.columns:
+        raise ValueError("Coluna 'Data' não encontrada no arquivo.")
+    s = df['Data']
+    primeiro = s.dropna().head(1).astype(str)
+    if len(primeiro) and re.fullmatch(r'\d{2}/\d{2}/\d{4}', primeiro.iloc[0]):
+        # Formato uniforme DD/MM/YYYY: parser C com formato fixo, sem a
+        # heurística elemento a elemento do dayfirst
+        df['Data'] = pd.to_datetime(s, format='%d/%m/%Y', errors='coerce').dt.normalize()
+    else:
+        df['Data'] = pd.to_datetime(s, dayfirst=True, errors='coerce').dt.normalize()
+    df = df.dropna(subset=['Data'])
+
+    # Converter tempo (HH:MM:SS) em minutos de forma vetorizada;
+    # astype(str) cobre tanto strings quanto objetos datetime.time
+    for col in TEMPO_COLS:
+        if col in df.columns:
+            td = pd.to_timedelta(df[col].astype(str).str.strip(), errors='coerce')
+            df[col + '_min'] = (td.dt.total_seconds() / 60).fillna(0)
+
+    # Ordenar e calcular dias de permanência
+    df = df.sort_values(['TAG', 'Data']).reset_index(drop=True)
+    # transform('min') usa o caminho nativo do groupby; a subtração é vetorizada
+    df['dias_permanencia'] = (df['Data'] - df.groupby('TAG', sort=False, observed=True)['Data'].transform('min')).dt.days
+
+    # Consolidar dados por TAG e Data (média de valores numéricos)
+    agg_spec = {
+        'Consumo de materia natural_Cocho': 'mean',
+        'Consumo_bebedouro': 'mean',
+        'Numero de visitar com consumo_Cocho': 'mean',
+        'Numero de visitas_Bebedouro': 'mean',
+        'Peso médio': 'mean',
+        'dias_permanencia': 'first',
+        'tempo de consumo_bebedouro_min': 'mean',
+        'Tempo de consumo_cocho_min': 'mean',
+    }
+    agg_spec = {k: v for k, v in agg_spec.items() if k in df.columns}
+    if df.duplicated(['TAG', 'Data']).any():
+        # O agg sobre ['TAG', 'Data'] já garante chaves únicas; nenhuma
+        # checagem de duplicatas é necessária depois dele
+        df = df.groupby(['TAG', 'Data'], sort=False, observed=True).agg(agg_spec).reset_index()
+    else:
+        # Já há no máximo uma linha por (TAG, Data): o agg de médias seria
+        # um no-op caro — basta selecionar as colunas na mesma ordem
+        df = df[['TAG', 'Data', *agg_spec]].reset_index(drop=True)
+
+    # Calcular ganho de peso diário (GPD) com proteção contra divisão por zero
+    if 'Peso médio' in df.columns:
+        # Um único objeto groupby para shift e diff: o índice de grupos é
+        # construído uma vez só (sort=False: o frame já está ordenado por TAG)
+        g = df.groupby('TAG', sort=False, observed=True)
+        df['peso_anterior'] = g['Peso médio'].shift(1)
+        df['dias_diff'] = g['dias_permanencia'].diff()
+        # Divisão, fillna e troca de infinitos fundidas em uma única
+        # passada: células inválidas (primeiro registro de cada TAG,
+        # divisor zero) ficam direto em 0
+        num = (df['Peso médio'] - df['peso_anterior']).to_numpy()
+        den = df['dias_diff'].to_numpy()
+        ok = np.isfinite(num) & np.isfinite(den) & (den > 0)
+        gpd = np.zeros_like(num)
+        np.divide(num, den, out=gpd, where=ok)
+        df['GPD'] = gpd
+    else:
+        df['GPD'] = 0
+
+    # Colunas auxiliares do GPD não são consumidas a jusante: removê-las
+    # poupa memória em cada filtro/groupby e encolhe o cache em Parquet
+    df = df.drop(columns=['peso_anterior', 'dias_diff'], errors='ignore')
+
+    # float32 basta para a precisão vinda do Excel e corta pela metade os
+    # bytes movidos por cada filtro/groupby/plot a jusante
+    for c in ['Consumo de materia natural_Cocho', 'Consumo_bebedouro', 'Peso médio',
+              'tempo de consumo_bebedouro_min', 'Tempo de consumo_cocho_min', 'GPD']:
+        if c in df.columns:
+            df[c] = df[c].astype('float32')
+
+    # TAG como categoria: filtros e groupbys passam a operar sobre códigos
+    # inteiros em vez de hashing de strings linha a linha
+    df['TAG'] = df['TAG'].astype('category')
+
+    return df
+
+
+def build_dataset(arquivo='Planilha completa.xlsx'):
+    """Carrega, limpa e consolida a planilha, retornando um DataFrame pronto.
+
+    O resultado limpo é persistido em Parquet em .cache/, chaveado pelo
+    hash do conteúdo do xlsx: se a planilha não mudou, o parse do Excel
+    é pulado inteiro; se mudou, o cache antigo é descartado sozinho.
+    """
+    with open(arquivo, 'rb') as f:
+        h = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    cache_parquet = os.path.join('.cache', f'{h}.parquet')
+    if os.path.exists(cache_parquet):
+        return pd.read_parquet(cache_parquet, engine='pyarrow')
+
+    df = clean_dataset(read_planilha(arquivo))
+
+    # Persiste o resultado limpo para execuções futuras pularem o
+    # read_excel, removendo caches de versões antigas da planilha
+    os.makedirs('.cache', exist_ok=True)
+    for velho in glob.glob(os.path.join('.cache', '*.parquet')):
+        if velho != cache_parquet:
+            os.remove(velho)
+    df.to_parquet(cache_parquet, compression='zstd', engine='pyarrow')
+    return df